@@ -1,19 +1,30 @@
-from flask import Flask, jsonify, render_template, request, send_from_directory
+from flask import Flask, Response, jsonify, render_template, request, send_from_directory
 from flask_cors import CORS
 from dotenv import load_dotenv
+from contextlib import contextmanager
 import requests
 import json
+import math
+import re
 import time
 from datetime import datetime
 import threading
+import logging
 import os
 
 load_dotenv() 
 app = Flask(__name__)
 CORS(app)
 
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger("vyuhmitra")
+
 RAILRADAR_API_KEY = os.getenv("rr_api_key")
 GEMINI_API_KEY = os.getenv("g_api_key")
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 60))  # seconds, per upstream call
 
 TARGET_STATIONS = ["PMD", "TIM", "RRJ", "PLU"]
 
@@ -61,6 +72,121 @@ gemini_analysis_results = {}
 all_trains_table_data = []
 background_processing_active = False  # Flag to control background processing
 
+# Metrics storage, exposed in Prometheus text format on /metrics
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+CYCLE_BUCKETS = (30, 60, 120, 180, 240, 300, 450, 600, 900, 1200)
+metrics_lock = threading.Lock()
+stage_latency = {}      # stage -> {'buckets': [...], 'sum': float, 'count': int}
+cycle_duration = {'buckets': [0] * len(CYCLE_BUCKETS), 'sum': 0.0, 'count': 0}
+upstream_requests = {}  # (upstream, outcome) -> count
+upstream_last_outcome = {}  # upstream -> last outcome
+gemini_tokens = {}      # (stage, kind) -> count
+gemini_parse_outcomes = {}  # (stage, outcome) -> count
+cycle_trains_pending = 0  # Trains still queued in the running cycle
+
+def observe_latency(histogram, buckets, seconds):
+    """Record one observation into a cumulative histogram"""
+    with metrics_lock:
+        for i, bound in enumerate(buckets):
+            if seconds <= bound:
+                histogram['buckets'][i] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+@contextmanager
+def timed_stage(stage):
+    """Time a pipeline stage into the per-stage latency histogram"""
+    with metrics_lock:
+        histogram = stage_latency.setdefault(
+            stage, {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0}
+        )
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_latency(histogram, LATENCY_BUCKETS, time.perf_counter() - start)
+
+def record_upstream(upstream, outcome):
+    """Count an upstream call outcome (success/error/timeout)"""
+    with metrics_lock:
+        key = (upstream, outcome)
+        upstream_requests[key] = upstream_requests.get(key, 0) + 1
+        upstream_last_outcome[upstream] = outcome
+
+def record_gemini_usage(stage, result):
+    """Count prompt, response, cached and thinking tokens from Gemini usageMetadata"""
+    usage = result.get('usageMetadata', {})
+    counts = {
+        'prompt': usage.get('promptTokenCount', 0),
+        'response': usage.get('candidatesTokenCount', 0),
+        'cached': usage.get('cachedContentTokenCount', 0),
+        'thoughts': usage.get('thoughtsTokenCount', 0)
+    }
+    with metrics_lock:
+        for kind, count in counts.items():
+            key = (stage, kind)
+            gemini_tokens[key] = gemini_tokens.get(key, 0) + count
+
+def record_parse_outcome(stage, outcome):
+    """Count how a Gemini response was parsed (clean/repaired/reasked/failed)"""
+    with metrics_lock:
+        key = (stage, outcome)
+        gemini_parse_outcomes[key] = gemini_parse_outcomes.get(key, 0) + 1
+
+def render_histogram(lines, name, labels, histogram, buckets):
+    """Append Prometheus histogram samples for one label set"""
+    prefix = f'{labels},' if labels else ''
+    for bound, count in zip(buckets, histogram['buckets']):
+        lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+    lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram["count"]}')
+    suffix = f'{{{labels}}}' if labels else ''
+    lines.append(f'{name}_sum{suffix} {histogram["sum"]:.6f}')
+    lines.append(f'{name}_count{suffix} {histogram["count"]}')
+
+def render_metrics():
+    """Render all metrics in Prometheus text exposition format"""
+    lines = []
+    with metrics_lock:
+        lines.append('# HELP vyuhmitra_stage_latency_seconds Latency of each pipeline stage.')
+        lines.append('# TYPE vyuhmitra_stage_latency_seconds histogram')
+        for stage, histogram in sorted(stage_latency.items()):
+            render_histogram(lines, 'vyuhmitra_stage_latency_seconds', f'stage="{stage}"',
+                             histogram, LATENCY_BUCKETS)
+
+        lines.append('# HELP vyuhmitra_cycle_duration_seconds Duration of a full processing cycle.')
+        lines.append('# TYPE vyuhmitra_cycle_duration_seconds histogram')
+        render_histogram(lines, 'vyuhmitra_cycle_duration_seconds', '', cycle_duration, CYCLE_BUCKETS)
+
+        lines.append('# HELP vyuhmitra_upstream_requests_total Upstream calls by outcome.')
+        lines.append('# TYPE vyuhmitra_upstream_requests_total counter')
+        for (upstream, outcome), count in sorted(upstream_requests.items()):
+            lines.append(f'vyuhmitra_upstream_requests_total{{upstream="{upstream}",outcome="{outcome}"}} {count}')
+
+        lines.append('# HELP vyuhmitra_gemini_tokens_total Gemini tokens by stage and kind (prompt/response/cached/thoughts).')
+        lines.append('# TYPE vyuhmitra_gemini_tokens_total counter')
+        for (stage, kind), count in sorted(gemini_tokens.items()):
+            lines.append(f'vyuhmitra_gemini_tokens_total{{stage="{stage}",kind="{kind}"}} {count}')
+
+        lines.append('# HELP vyuhmitra_gemini_parse_total Gemini responses by parse outcome.')
+        lines.append('# TYPE vyuhmitra_gemini_parse_total counter')
+        for (stage, outcome), count in sorted(gemini_parse_outcomes.items()):
+            lines.append(f'vyuhmitra_gemini_parse_total{{stage="{stage}",outcome="{outcome}"}} {count}')
+
+        lines.append('# HELP vyuhmitra_cycle_trains_pending Trains still queued in the running cycle.')
+        lines.append('# TYPE vyuhmitra_cycle_trains_pending gauge')
+        lines.append(f'vyuhmitra_cycle_trains_pending {cycle_trains_pending}')
+
+    lines.append('# HELP vyuhmitra_trains_processed Trains with a stored Gemini analysis.')
+    lines.append('# TYPE vyuhmitra_trains_processed gauge')
+    lines.append(f'vyuhmitra_trains_processed {len(processed_trains_data)}')
+    lines.append('# HELP vyuhmitra_table_rows Rows currently in the trains table.')
+    lines.append('# TYPE vyuhmitra_table_rows gauge')
+    lines.append(f'vyuhmitra_table_rows {len(all_trains_table_data)}')
+    lines.append('# HELP vyuhmitra_background_processing_active Whether the cycle loop is running.')
+    lines.append('# TYPE vyuhmitra_background_processing_active gauge')
+    lines.append(f'vyuhmitra_background_processing_active {int(background_processing_active)}')
+    return '\n'.join(lines) + '\n'
+
 @app.route('/')
 def index():
     """Serve the main dashboard page"""
@@ -76,34 +202,419 @@ def fetch_train_data(train_number):
     Fetch data for a single train
     """
     try:
-        response = requests.get(
-            f"https://railradar.in/api/v1/trains/{train_number}",
-            headers={"x-api-key": RAILRADAR_API_KEY},
-            params={
-                "journeyDate": datetime.now().strftime("%Y-%m-%d"),
-                "dataType": "live",
-                "provider": "railradar",
-                "userId": ""
-            },
-        )
+        with timed_stage('railradar_fetch'):
+            response = requests.get(
+                f"https://railradar.in/api/v1/trains/{train_number}",
+                headers={"x-api-key": RAILRADAR_API_KEY},
+                params={
+                    "journeyDate": datetime.now().strftime("%Y-%m-%d"),
+                    "dataType": "live",
+                    "provider": "railradar",
+                    "userId": ""
+                },
+                timeout=REQUEST_TIMEOUT,
+            )
         
         if response.status_code == 200:
-            return response.json()
+            train_data = response.json()
+            record_upstream('railradar', 'success')
+            return train_data
         else:
-            print(f"❌ HTTP {response.status_code} for train {train_number}")
+            record_upstream('railradar', 'error')
+            logger.warning("RailRadar HTTP %s for train %s", response.status_code, train_number)
             return None
             
+    except requests.Timeout:
+        record_upstream('railradar', 'timeout')
+        logger.warning("RailRadar timed out for train %s", train_number)
+        return None
     except Exception as e:
-        print(f"💥 Error fetching train {train_number}: {e}")
+        record_upstream('railradar', 'error')
+        logger.error("Error fetching train %s: %s", train_number, e)
+        return None
+
+# Response schemas sent to Gemini as generationConfig.responseSchema and
+# used to validate/repair whatever comes back
+ANALYSIS_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "train_name": {"type": "STRING"},
+        "table_data": {
+            "type": "OBJECT",
+            "properties": {
+                "name": {"type": "STRING", "description": "Train name"},
+                "current_location": {"type": "STRING", "description": "Station name"},
+                "scheduled": {"type": "STRING", "description": "HH:MM"},
+                "actual": {"type": "STRING", "description": "HH:MM"},
+                "delay": {"type": "NUMBER", "description": "Delay in minutes"},
+                "priority": {"type": "STRING", "enum": ["High", "Medium", "Low"]},
+                "status": {"type": "STRING"}
+            },
+            "required": ["name", "current_location", "scheduled", "actual", "delay", "priority", "status"]
+        },
+        "is_near_target_stations": {"type": "BOOLEAN"},
+        "current_location_detail": {
+            "type": "OBJECT",
+            "properties": {
+                "station_code": {"type": "STRING"},
+                "station_name": {"type": "STRING"},
+                "status": {"type": "STRING"}
+            }
+        },
+        "next_station": {
+            "type": "OBJECT",
+            "properties": {
+                "code": {"type": "STRING"},
+                "name": {"type": "STRING"},
+                "scheduled_arrival": {"type": "STRING"},
+                "estimated_arrival": {"type": "STRING"},
+                "delay_minutes": {"type": "NUMBER"}
+            }
+        },
+        "reason": {"type": "STRING"}
+    },
+    "required": ["train_name", "table_data", "is_near_target_stations"]
+}
+
+SOLUTIONS_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "solutions": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "solution_type": {
+                        "type": "STRING",
+                        "enum": ["platform_reassignment", "speed_adjustment",
+                                 "route_optimization", "congestion_management"]
+                    },
+                    "description": {
+                        "type": "STRING",
+                        "description": "Exact actionable steps with station, track, timing, speed if applicable"
+                    },
+                    "expected_impact_minutes": {"type": "NUMBER"},
+                    "priority": {"type": "STRING", "enum": ["High", "Medium", "Low"]},
+                    "implementation_complexity": {"type": "STRING", "enum": ["Low", "Medium", "High"]}
+                },
+                "required": ["solution_type", "description", "expected_impact_minutes", "priority"]
+            }
+        },
+        "overall_confidence": {"type": "NUMBER", "description": "0-100"},
+        "throughput_improvement_potential": {"type": "STRING", "description": "Short, realistic description"}
+    },
+    "required": ["solutions", "overall_confidence"]
+}
+
+JSON_NUMBER = re.compile(r'-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?')
+
+def close_json_prefix(text):
+    """
+    Scan a (possibly truncated) JSON object and close it at the last point
+    where every value seen so far was complete, dropping trailing commas.
+    Returns None if no object starts.
+    """
+    start = text.find('{')
+    if start == -1:
+        return None
+    
+    out = []
+    stack = []  # [closer, expecting] per open container
+    safe_end, safe_closers = None, None
+    in_string = escaped = False
+    token = ''
+    
+    def expecting():
+        return stack[-1][1] if stack else 'value'
+    
+    def value_done():
+        nonlocal safe_end, safe_closers
+        stack[-1][1] = 'after_value'
+        safe_end, safe_closers = len(out), ''.join(closer for closer, _ in reversed(stack))
+    
+    def scalar_complete(value):
+        return value in ('true', 'false', 'null') or JSON_NUMBER.fullmatch(value) is not None
+    
+    for char in text[start:]:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+                if expecting() == 'key':
+                    stack[-1][1] = 'colon'
+                else:
+                    value_done()
+            continue
+        
+        if token and not (char.isalnum() or char in '.+-'):
+            if not scalar_complete(token):
+                break
+            token = ''
+            value_done()
+        
+        if char.isspace():
+            out.append(char)
+        elif char.isalnum() or char in '.+-':
+            if expecting() != 'value':
+                break
+            token += char
+            out.append(char)
+        elif char == '"':
+            if expecting() not in ('key', 'value'):
+                break
+            in_string = True
+            out.append(char)
+        elif char in '{[':
+            if expecting() != 'value':
+                break
+            stack.append(['}', 'key'] if char == '{' else [']', 'value'])
+            out.append(char)
+            safe_end, safe_closers = len(out), ''.join(closer for closer, _ in reversed(stack))
+        elif char in '}]':
+            if not stack or stack[-1][0] != char or expecting() == 'colon':
+                break
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            stack.pop()
+            out.append(char)
+            if not stack:
+                return ''.join(out)
+            value_done()
+        elif char == ':' and expecting() == 'colon':
+            stack[-1][1] = 'value'
+            out.append(char)
+        elif char == ',' and expecting() == 'after_value':
+            stack[-1][1] = 'key' if stack[-1][0] == '}' else 'value'
+            out.append(char)
+        else:
+            break
+    else:
+        # A number cut off by the end of input may be missing digits, so only
+        # literals count as complete here; the field is re-asked instead
+        if token in ('true', 'false', 'null'):
+            value_done()
+    
+    if safe_end is None:
+        return None
+    return ''.join(out[:safe_end]) + safe_closers
+
+def parse_json_tolerant(text):
+    """
+    Parse Gemini output into a dict, tolerating markdown fences, stray text
+    around the object, trailing commas and truncation. Returns (data, repaired).
+    """
+    cleaned = text.replace('```json', '').replace('```', '').strip()
+    try:
+        data = json.loads(cleaned)
+        if isinstance(data, dict):
+            return data, False
+    except ValueError:
+        pass
+    
+    candidate = close_json_prefix(cleaned)
+    if candidate is None:
+        return None, True
+    try:
+        data = json.loads(candidate)
+    except ValueError:
+        return None, True
+    return (data, True) if isinstance(data, dict) else (None, True)
+
+def coerce_to_schema(value, schema):
+    """
+    Coerce a value to the given schema node, fixing common model defects
+    (numbers as strings, enum casing). Raises ValueError if it cannot be used.
+    """
+    value_type = schema.get("type")
+    
+    if value_type == "OBJECT":
+        if not isinstance(value, dict):
+            raise ValueError("expected object")
+        cleaned, missing = validate_against_schema(value, schema)
+        if missing:
+            raise ValueError(f"missing {missing}")
+        return cleaned
+    
+    if value_type == "ARRAY":
+        if not isinstance(value, list):
+            raise ValueError("expected array")
+        items = []
+        for item in value:
+            try:
+                items.append(coerce_to_schema(item, schema["items"]))
+            except ValueError:
+                continue  # Drop invalid items, keep the rest
+        if value and not items:
+            raise ValueError("no valid items")
+        return items
+    
+    if value_type == "NUMBER":
+        if isinstance(value, bool):
+            raise ValueError("expected number")
+        if isinstance(value, (int, float)):
+            number = value
+        else:
+            # Accept a bare number, optionally in minutes ("15 min"); other units are re-asked
+            match = re.fullmatch(r'\s*(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)\s*(?:(?:m|mins?|minutes?)\.?)?\s*',
+                                 str(value), re.IGNORECASE)
+            if not match:
+                raise ValueError("expected number")
+            number = float(match.group(1))
+        if not math.isfinite(number):
+            raise ValueError("expected finite number")
+        if isinstance(number, float) and number.is_integer():
+            return int(number)
+        return number
+    
+    if value_type == "BOOLEAN":
+        if isinstance(value, bool):
+            return value
+        if str(value).strip().lower() in ('true', 'yes'):
+            return True
+        if str(value).strip().lower() in ('false', 'no'):
+            return False
+        raise ValueError("expected boolean")
+    
+    if value is None or isinstance(value, (dict, list)):
+        raise ValueError("expected string")
+    value = str(value).strip()
+    if "enum" in schema:
+        for option in schema["enum"]:
+            if option.lower() == value.lower():
+                return option
+        raise ValueError(f"not one of {schema['enum']}")
+    return value
+
+def validate_against_schema(data, schema):
+    """
+    Validate the top-level properties of an object against a schema.
+    Returns (cleaned, missing) where missing lists required fields that
+    were absent or could not be repaired. Invalid optional fields are dropped.
+    """
+    cleaned = {}
+    missing = []
+    for key, property_schema in schema["properties"].items():
+        if key in data:
+            try:
+                cleaned[key] = coerce_to_schema(data[key], property_schema)
+                continue
+            except ValueError as e:
+                logger.debug("Dropping invalid field %s: %s", key, e)
+        if key in schema.get("required", []):
+            missing.append(key)
+    return cleaned, missing
+
+def post_gemini(stage, prompt, schema):
+    """
+    Send a prompt to Gemini requesting JSON output matching schema.
+    Returns the response text, or None on failure.
+    """
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={GEMINI_API_KEY}"
+    
+    payload = {
+        "contents": [{
+            "parts": [{"text": prompt}]
+        }],
+        "generationConfig": {
+            "responseMimeType": "application/json",
+            "responseSchema": schema
+        }
+    }
+    
+    try:
+        with timed_stage(stage):
+            response = requests.post(url, json=payload, timeout=REQUEST_TIMEOUT)
+    except requests.Timeout:
+        record_upstream('gemini', 'timeout')
+        logger.warning("Gemini %s timed out", stage)
+        return None
+    except requests.RequestException as e:
+        record_upstream('gemini', 'error')
+        logger.error("Gemini %s request failed: %s", stage, e)
+        return None
+    
+    if response.status_code != 200:
+        record_upstream('gemini', 'error')
+        logger.warning("Gemini %s HTTP %s", stage, response.status_code)
+        return None
+    
+    try:
+        result = response.json()
+    except ValueError as e:
+        record_upstream('gemini', 'error')
+        logger.error("Gemini %s returned a non-JSON body: %s", stage, e)
+        return None
+    
+    record_upstream('gemini', 'success')
+    record_gemini_usage(stage, result)
+    
+    # A candidate cut off by MAX_TOKENS or safety may carry no parts at all
+    candidates = result.get('candidates') or [{}]
+    parts = candidates[0].get('content', {}).get('parts', [])
+    return ''.join(part.get('text', '') for part in parts)
+
+def parse_gemini_response(text, schema):
+    """Tolerantly parse and validate a Gemini response. Returns (data, missing, repaired)"""
+    with timed_stage('json_parse'):
+        data, repaired = parse_json_tolerant(text)
+        if data is None:
+            return {}, list(schema.get("required", [])), True
+        cleaned, missing = validate_against_schema(data, schema)
+        return cleaned, missing, repaired or len(cleaned) < len(data)
+
+def call_gemini(stage, prompt, schema):
+    """
+    Send a prompt to Gemini and return the parsed JSON response, or None on failure.
+    Required fields that are missing or invalid are re-asked once, on their own.
+    """
+    text = post_gemini(stage, prompt, schema)
+    if text is None:
+        return None
+    
+    data, missing, repaired = parse_gemini_response(text, schema)
+    if not missing:
+        record_parse_outcome(stage, 'repaired' if repaired else 'clean')
+        return data
+    
+    logger.info("Gemini %s response missing %s, re-asking for those fields", stage, missing)
+    missing_schema = {
+        "type": "OBJECT",
+        "properties": {key: schema["properties"][key] for key in missing},
+        "required": missing
+    }
+    repair_prompt = f"""{prompt}
+
+A previous answer to this request was incomplete. These fields were already extracted:
+{json.dumps(data, indent=2)}
+
+Provide only the missing fields: {', '.join(missing)}
+"""
+    text = post_gemini(f'{stage}_reask', repair_prompt, missing_schema)
+    if text is None:
+        record_parse_outcome(stage, 'failed')
+        return None
+    
+    extra, still_missing, _ = parse_gemini_response(text, missing_schema)
+    if still_missing:
+        logger.warning("Gemini %s still missing %s after re-ask", stage, still_missing)
+        record_parse_outcome(stage, 'failed')
         return None
+    
+    data.update(extra)
+    record_parse_outcome(stage, 'reasked')
+    return data
 
 def ask_gemini_analyze_single_train(train_number, train_data):
     """
     Send single train data to Gemini for analysis and extract table data
     """
     try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={GEMINI_API_KEY}"
-        
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         prompt = f"""
@@ -132,60 +643,18 @@ def ask_gemini_analyze_single_train(train_number, train_data):
            - Low: Passenger trains or trains with >30 min delay
         4. Consider the trains which are delay currently not before. So use current time and then calculate what is delay at current time
             and at current which trains are delay, return that only no need to return befor delayed trains.
-
-        Return ONLY valid JSON format without any markdown:
-        {{
-          "train_number": "{train_number}",
-          "train_name": "string",
-          "table_data": {{
-            "name": "string (train name)",
-            "current_location": "string (station name)",
-            "scheduled": "string (HH:MM format)",
-            "actual": "string (HH:MM format)", 
-            "delay": "number (minutes)",
-            "priority": "string (High/Medium/Low)",
-            "status": "string"
-          }},
-          "analysis_time": "{current_time}",
-          "is_near_target_stations": true/false,
-          "current_location_detail": {{
-            "station_code": "string",
-            "station_name": "string",
-            "status": "string"
-          }},
-          "next_station": {{
-            "code": "string",
-            "name": "string",
-            "scheduled_arrival": "string",
-            "estimated_arrival": "string",
-            "delay_minutes": number
-          }},
-          "reason": "string"
-        }}
         """
         
-        payload = {
-            "contents": [{
-                "parts": [{"text": prompt}]
-            }]
-        }
-        
-        print(f"🤖 Sending train {train_number} to Gemini for analysis...")
-        response = requests.post(url, json=payload)
-        
-        if response.status_code == 200:
-            result = response.json()
-            gemini_response = result['candidates'][0]['content']['parts'][0]['text']
-            cleaned_response = gemini_response.replace('```json', '').replace('```', '').strip()
-            parsed_response = json.loads(cleaned_response)
-            print(f"✅ Gemini analysis completed for train {train_number}!")
-            return parsed_response
-        else:
-            print(f"❌ Gemini API Error for train {train_number}: {response.status_code}")
-            return None
+        logger.debug("Sending train %s to Gemini for analysis", train_number)
+        parsed_response = call_gemini('gemini_analysis', prompt, ANALYSIS_RESPONSE_SCHEMA)
+        if parsed_response is not None:
+            parsed_response['train_number'] = train_number
+            parsed_response['analysis_time'] = current_time
+            logger.debug("Gemini analysis completed for train %s", train_number)
+        return parsed_response
             
     except Exception as e:
-        print(f"💥 Gemini analysis error for train {train_number}: {str(e)}")
+        logger.error("Gemini analysis error for train %s: %s", train_number, e)
         return None
 
 def ask_gemini_generate_solutions(train_data, delay_reason):
@@ -193,21 +662,6 @@ def ask_gemini_generate_solutions(train_data, delay_reason):
     Ask Gemini to generate solutions for delayed trains to improve throughput
     """
     try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={GEMINI_API_KEY}"
-        
-        json_template = '''{
-"solutions": [
-{
-"solution_type": "string (platform_reassignment/speed_adjustment/route_optimization/congestion_management)",
-"description": "string (exact actionable steps with station, track, timing, speed if applicable)",
-"expected_impact_minutes": number,
-"priority": "High/Medium/Low",
-"implementation_complexity": "Low/Medium/High"
-}
-],
-"overall_confidence": number (0-100),
-"throughput_improvement_potential": "string (short, realistic description)"
-}'''
         prompt = f"""
 You are a railway operations expert. Analyze the delayed train and generate multiple practical, actionable solutions to recover lost time and improve overall throughput.
 
@@ -246,52 +700,35 @@ Must be feasible under current network and schedule constraints
 Should recover lost time and maximize overall throughput
 
 Provide only actionable, implementable steps; no pseudo-code or placeholders
-
-Output format (strict JSON, no markdown):
-
-{json_template}
 """
 
         
-        payload = {
-            "contents": [{
-                "parts": [{"text": prompt}]
-            }]
-        }
-        
-        print(f"🤖 Generating solutions for delayed train...")
-        response = requests.post(url, json=payload)
-        
-        if response.status_code == 200:
-            result = response.json()
-            gemini_response = result['candidates'][0]['content']['parts'][0]['text']
-            cleaned_response = gemini_response.replace('```json', '').replace('```', '').strip()
-            parsed_response = json.loads(cleaned_response)
-            print(f"✅ Solutions generated successfully!")
-            return parsed_response
-        else:
-            print(f"❌ Gemini solutions generation error: {response.status_code}")
-            return None
+        logger.debug("Generating solutions for delayed train")
+        parsed_response = call_gemini('gemini_solutions', prompt, SOLUTIONS_RESPONSE_SCHEMA)
+        if parsed_response is not None:
+            logger.debug("Solutions generated successfully")
+        return parsed_response
             
     except Exception as e:
-        print(f"💥 Solutions generation error: {str(e)}")
+        logger.error("Solutions generation error: %s", e)
         return None
 
 def process_trains_sequentially():
     """
     Process all 32 trains sequentially and send each to Gemini individually
     """
-    global processed_trains_data, gemini_analysis_results, all_trains_table_data
+    global processed_trains_data, gemini_analysis_results, all_trains_table_data, cycle_trains_pending
     
-    print("🚆 STARTING SEQUENTIAL PROCESSING OF 32 TRAINS")
-    print("=" * 60)
+    logger.info("Starting sequential processing of %d trains", TRAINS_ARRAY["count"])
+    cycle_start = time.perf_counter()
     
     train_numbers = [train["number"] for train in TRAINS_ARRAY["trains"]]
     successful_trains = []
     all_trains_table_data = []  # Reset table data
+    cycle_trains_pending = len(train_numbers)
     
     for i, train_number in enumerate(train_numbers, 1):
-        print(f"\n[{i}/32] Processing train {train_number}...")
+        logger.debug("[%d/%d] Processing train %s", i, len(train_numbers), train_number)
         
         # Step 1: Fetch train data from RailRadar
         train_data = fetch_train_data(train_number)
@@ -315,7 +752,7 @@ def process_trains_sequentially():
                     all_trains_table_data.append(table_entry)
                 
                 successful_trains.append(train_number)
-                print(f"   ✅ Successfully processed train {train_number}")
+                logger.debug("Successfully processed train %s", train_number)
                 
                 # Generate solutions for delayed trains
                 delay = gemini_analysis.get('table_data', {}).get('delay', 0)
@@ -339,9 +776,11 @@ def process_trains_sequentially():
                         'reason': gemini_analysis.get('reason', 'N/A')
                     })
             else:
-                print(f"   ❌ Gemini analysis failed for train {train_number}")
+                logger.info("Gemini analysis failed for train %s", train_number)
         else:
-            print(f"   ❌ Failed to fetch data for train {train_number}")
+            logger.info("Failed to fetch data for train %s", train_number)
+        
+        cycle_trains_pending -= 1
         
         # Add delay to avoid rate limiting
         time.sleep(2)
@@ -354,8 +793,11 @@ def process_trains_sequentially():
         'target_stations': TARGET_STATIONS
     }
     
-    print(f"\n📊 Processing completed: {len(successful_trains)}/{len(train_numbers)} trains successful")
-    print(f"🎯 Trains near target stations: {len(gemini_analysis_results.get('trains_near_stations', []))}")
+    observe_latency(cycle_duration, CYCLE_BUCKETS, time.perf_counter() - cycle_start)
+    
+    logger.info("Processing completed: %d/%d trains successful, %d near target stations",
+                len(successful_trains), len(train_numbers),
+                len(gemini_analysis_results.get('trains_near_stations', [])))
 
 def start_background_processing():
     """Start background processing of trains"""
@@ -374,13 +816,13 @@ def start_background_processing():
         background_processing_active = True
         thread = threading.Thread(target=process_job, daemon=True)
         thread.start()
-        print("🔄 Background processing started...")
+        logger.info("Background processing started")
 
 def stop_background_processing():
     """Stop background processing"""
     global background_processing_active
     background_processing_active = False
-    print("⏹️ Background processing stopped...")
+    logger.info("Background processing stopped")
 
 # API Endpoints
 
@@ -650,11 +1092,19 @@ def get_trains_near_stations():
 @app.route('/api/system/status')
 def get_system_status():
     """Get system status"""
+    gemini_outcome = upstream_last_outcome.get('gemini')
+    if gemini_outcome is None:
+        gemini_status = 'unknown'
+    elif gemini_outcome == 'success':
+        gemini_status = 'connected'
+    else:
+        gemini_status = 'disconnected'
+    
     return jsonify({
         'success': True,
         'data': {
             'railradar_api': 'connected' if processed_trains_data else 'disconnected',
-            'gemini_ai': 'connected',
+            'gemini_ai': gemini_status,
             'processing_status': 'running' if background_processing_active else 'stopped',
             'last_processed': datetime.now().isoformat(),
             'trains_processed': len(processed_trains_data),
@@ -664,6 +1114,12 @@ def get_system_status():
         'timestamp': datetime.now().isoformat()
     })
 
+# Prometheus scrape endpoint
+@app.route('/metrics')
+def metrics():
+    """Expose pipeline metrics in Prometheus text format"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 # Health check endpoint for Render
 @app.route('/health')
 def health_check():
@@ -682,9 +1138,10 @@ if __name__ == '__main__':
     # Create static directory if it doesn't exist
     os.makedirs('static', exist_ok=True)
     
-    print("🚀 Starting VyuhMitra Backend Server...")
-    print("📊 Dashboard available at: http://127.0.0.1:10000")
-    print("🔗 API endpoints available at: http://127.0.0.1:10000/api/")
-    print("⏸️  Data processing is stopped initially. Use the start button to begin.")
     port = int(os.getenv("PORT", 10000))
+    logger.info("Starting VyuhMitra Backend Server...")
+    logger.info("Dashboard available at: http://127.0.0.1:%d", port)
+    logger.info("API endpoints available at: http://127.0.0.1:%d/api/", port)
+    logger.info("Metrics available at: http://127.0.0.1:%d/metrics", port)
+    logger.info("Data processing is stopped initially. Use the start button to begin.")
     app.run(debug=False, host='0.0.0.0', port=port)
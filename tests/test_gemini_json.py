@@ -0,0 +1,198 @@
+import json
+
+import pytest
+
+import index
+from index import (ANALYSIS_RESPONSE_SCHEMA, SOLUTIONS_RESPONSE_SCHEMA, call_gemini, close_json_prefix,
+                   coerce_to_schema, parse_json_tolerant, validate_against_schema)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"train_name": "X", "is_near_target_stations": true', {"train_name": "X", "is_near_target_stations": True}),
+    ('{"a": "x"', {"a": "x"}),
+    ('{"a": [1, 2]', {"a": [1, 2]}),
+    ('{"a": 12, "b": false', {"a": 12, "b": False}),
+    ('{"a": {"b": null', {"a": {"b": None}}),
+    ('{"a": [', {"a": []}),
+])
+def test_truncation_keeps_last_complete_value(text, expected):
+    assert parse_json_tolerant(text) == (expected, True)
+
+
+@pytest.mark.parametrize("text", [
+    '{"a": 1, "b"',
+    '{"a": 1, "b":',
+    '{"a": 1, "b": "tr',
+    '{"a": 1, "b": tru',
+    '{"a": 1, "b": -',
+    '{"a": 1, "b": 125',
+    '{"a": 1, "b": 1.5e',
+])
+def test_truncation_drops_incomplete_trailing_field(text):
+    assert parse_json_tolerant(text) == ({"a": 1}, True)
+
+
+def test_truncated_number_in_array_dropped():
+    assert parse_json_tolerant('{"a": [1, 23') == ({"a": [1]}, True)
+
+
+def test_trailing_commas_dropped_outside_strings():
+    assert parse_json_tolerant('{"a": {"b": 1,}, "c": [1, 2,],}') == ({"a": {"b": 1}, "c": [1, 2]}, True)
+
+
+def test_trailing_comma_pattern_inside_string_untouched():
+    assert parse_json_tolerant('{"a":"x, }",}') == ({"a": "x, }"}, True)
+
+
+def test_escaped_quote_does_not_end_string():
+    assert parse_json_tolerant('{"a": "say \\"hi\\", }"') == ({"a": 'say "hi", }'}, True)
+
+
+def test_fences_and_surrounding_text():
+    assert parse_json_tolerant('```json\n{"a": 1}\n```') == ({"a": 1}, False)
+    assert parse_json_tolerant('Result: {"a": 1} done') == ({"a": 1}, True)
+
+
+def test_no_object():
+    assert close_json_prefix('no json here') is None
+    assert parse_json_tolerant('no json here') == (None, True)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (15, 15),
+    ("15", 15),
+    ("15 min", 15),
+    ("-2.5 mins", -2.5),
+    ("1e3", 1000),
+    (" 12 minutes ", 12),
+    ("5m", 5),
+    ("20 Mins", 20),
+    (15.0, 15),
+])
+def test_number_coercion(value, expected):
+    assert coerce_to_schema(value, {"type": "NUMBER"}) == expected
+
+
+@pytest.mark.parametrize("value", [
+    "delayed by -5 to 10", "about 10", "N/A", True, "10 - 15 min",
+    "2 hours", "3 hrs", "1 h", "15 e", "10 km", "1e400", float("inf"), float("nan"),
+])
+def test_number_coercion_rejects_ambiguous_text(value):
+    with pytest.raises(ValueError):
+        coerce_to_schema(value, {"type": "NUMBER"})
+
+
+TABLE_DATA = {"name": "Prashanti Express", "current_location": "Puttaparthi", "scheduled": "10:00",
+              "actual": "10:25", "delay": 25, "priority": "Medium", "status": "Delayed"}
+
+
+def test_validate_fixes_enum_case_and_yes_no_booleans():
+    data = {"train_name": "X", "table_data": dict(TABLE_DATA, priority="medium", delay="25 min"),
+            "is_near_target_stations": "yes"}
+    cleaned, missing = validate_against_schema(data, ANALYSIS_RESPONSE_SCHEMA)
+    assert missing == []
+    assert cleaned["table_data"]["priority"] == "Medium"
+    assert cleaned["table_data"]["delay"] == 25
+    assert cleaned["is_near_target_stations"] is True
+    
+    cleaned, _ = validate_against_schema(dict(data, is_near_target_stations="No"), ANALYSIS_RESPONSE_SCHEMA)
+    assert cleaned["is_near_target_stations"] is False
+
+
+def test_validate_drops_invalid_optional_and_reports_missing_required():
+    data = {"train_name": "X", "table_data": dict(TABLE_DATA, delay="2 hours"),
+            "is_near_target_stations": "maybe", "reason": ["not", "a", "string"]}
+    cleaned, missing = validate_against_schema(data, ANALYSIS_RESPONSE_SCHEMA)
+    assert cleaned == {"train_name": "X"}
+    assert missing == ["table_data", "is_near_target_stations"]
+
+
+def test_validate_drops_invalid_array_items():
+    good = {"solution_type": "Speed_Adjustment", "description": "Raise speed by 10 km/h",
+            "expected_impact_minutes": "5", "priority": "high"}
+    bad_enum = dict(good, solution_type="teleport")
+    no_description = {key: value for key, value in good.items() if key != "description"}
+    data = {"solutions": [good, bad_enum, no_description, "text"], "overall_confidence": 80}
+    
+    cleaned, missing = validate_against_schema(data, SOLUTIONS_RESPONSE_SCHEMA)
+    assert missing == []
+    assert cleaned["solutions"] == [{"solution_type": "speed_adjustment", "description": "Raise speed by 10 km/h",
+                                     "expected_impact_minutes": 5, "priority": "High"}]
+
+
+def test_validate_rejects_array_with_no_valid_items():
+    data = {"solutions": [{"solution_type": "teleport"}], "overall_confidence": 80}
+    assert validate_against_schema(data, SOLUTIONS_RESPONSE_SCHEMA) == ({"overall_confidence": 80}, ["solutions"])
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """Stub post_gemini with queued responses and record each call"""
+    calls = []
+    responses = []
+    
+    def post_gemini(stage, prompt, schema):
+        calls.append({"stage": stage, "prompt": prompt, "schema": schema})
+        return responses.pop(0)
+    
+    monkeypatch.setattr(index, "post_gemini", post_gemini)
+    monkeypatch.setattr(index, "gemini_parse_outcomes", {})
+    return calls, responses
+
+
+def test_call_gemini_clean_response_makes_one_call(gemini):
+    calls, responses = gemini
+    responses.append(json.dumps({"train_name": "X", "table_data": TABLE_DATA, "is_near_target_stations": True}))
+    
+    assert call_gemini("gemini_analysis", "prompt", ANALYSIS_RESPONSE_SCHEMA)["train_name"] == "X"
+    assert len(calls) == 1
+    assert index.gemini_parse_outcomes == {("gemini_analysis", "clean"): 1}
+
+
+def test_call_gemini_reasks_only_missing_fields_and_merges(gemini):
+    calls, responses = gemini
+    responses.append('{"train_name": "X", "table_data": %s, "reason": "Signal failure", "is_near' % json.dumps(TABLE_DATA))
+    responses.append('{"is_near_target_stations": false}')
+    
+    data = call_gemini("gemini_analysis", "prompt", ANALYSIS_RESPONSE_SCHEMA)
+    
+    assert data == {"train_name": "X", "table_data": TABLE_DATA, "reason": "Signal failure",
+                    "is_near_target_stations": False}
+    assert len(calls) == 2
+    reask = calls[1]
+    assert reask["stage"] == "gemini_analysis_reask"
+    assert reask["schema"] == {
+        "type": "OBJECT",
+        "properties": {"is_near_target_stations": ANALYSIS_RESPONSE_SCHEMA["properties"]["is_near_target_stations"]},
+        "required": ["is_near_target_stations"],
+    }
+    assert '"train_name": "X"' in reask["prompt"]
+    assert index.gemini_parse_outcomes == {("gemini_analysis", "reasked"): 1}
+
+
+def test_call_gemini_incomplete_reask_returns_none(gemini):
+    calls, responses = gemini
+    responses.append('{"train_name": "X"}')
+    responses.append('{"table_data": %s}' % json.dumps(TABLE_DATA))
+    
+    assert call_gemini("gemini_analysis", "prompt", ANALYSIS_RESPONSE_SCHEMA) is None
+    assert set(calls[1]["schema"]["required"]) == {"table_data", "is_near_target_stations"}
+    assert index.gemini_parse_outcomes == {("gemini_analysis", "failed"): 1}
+
+
+def test_call_gemini_failed_reask_returns_none(gemini):
+    calls, responses = gemini
+    responses.append('{"train_name": "X"}')
+    responses.append(None)
+    
+    assert call_gemini("gemini_analysis", "prompt", ANALYSIS_RESPONSE_SCHEMA) is None
+    assert len(calls) == 2
+    assert index.gemini_parse_outcomes == {("gemini_analysis", "failed"): 1}
+
+
+def test_call_gemini_upstream_failure_does_not_reask(gemini):
+    calls, responses = gemini
+    responses.append(None)
+    
+    assert call_gemini("gemini_analysis", "prompt", ANALYSIS_RESPONSE_SCHEMA) is None
+    assert len(calls) == 1
@@ -0,0 +1,154 @@
+import re
+from unittest import mock
+
+import pytest
+import requests
+
+import index
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics(monkeypatch):
+    monkeypatch.setattr(index, 'stage_latency', {})
+    monkeypatch.setattr(index, 'cycle_duration',
+                        {'buckets': [0] * len(index.CYCLE_BUCKETS), 'sum': 0.0, 'count': 0})
+    monkeypatch.setattr(index, 'upstream_requests', {})
+    monkeypatch.setattr(index, 'upstream_last_outcome', {})
+    monkeypatch.setattr(index, 'gemini_tokens', {})
+    monkeypatch.setattr(index, 'gemini_parse_outcomes', {})
+
+
+def make_response(status_code=200, body=None, text='not json'):
+    response = mock.Mock(status_code=status_code)
+    if body is None:
+        response.json.side_effect = ValueError(text)
+    else:
+        response.json.return_value = body
+    return response
+
+
+def test_histogram_buckets_are_cumulative():
+    buckets = (1, 5)
+    histogram = {'buckets': [0, 0], 'sum': 0.0, 'count': 0}
+    for seconds in (0.5, 3, 10):
+        index.observe_latency(histogram, buckets, seconds)
+    
+    assert histogram['buckets'] == [1, 2]
+    assert histogram['count'] == 3
+    assert histogram['sum'] == 13.5
+    
+    lines = []
+    index.render_histogram(lines, 'test_seconds', 'stage="x"', histogram, buckets)
+    assert lines == [
+        'test_seconds_bucket{stage="x",le="1"} 1',
+        'test_seconds_bucket{stage="x",le="5"} 2',
+        'test_seconds_bucket{stage="x",le="+Inf"} 3',
+        'test_seconds_sum{stage="x"} 13.500000',
+        'test_seconds_count{stage="x"} 3',
+    ]
+
+
+def test_unlabelled_histogram():
+    lines = []
+    index.render_histogram(lines, 'test_seconds', '', {'buckets': [1], 'sum': 2.0, 'count': 2}, (1,))
+    assert lines[1] == 'test_seconds_bucket{le="+Inf"} 2'
+    assert lines[2:] == ['test_seconds_sum 2.000000', 'test_seconds_count 2']
+
+
+SAMPLE = re.compile(r'^([a-z_]+)(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? -?[0-9.]+$')
+
+
+def test_render_metrics_is_well_formed():
+    with index.timed_stage('railradar_fetch'):
+        pass
+    index.observe_latency(index.cycle_duration, index.CYCLE_BUCKETS, 42)
+    index.record_upstream('railradar', 'success')
+    index.record_upstream('gemini', 'timeout')
+    index.record_gemini_usage('gemini_analysis', {'usageMetadata': {'promptTokenCount': 7}})
+    index.record_parse_outcome('gemini_analysis', 'clean')
+    
+    text = index.render_metrics()
+    assert text.endswith('\n')
+    
+    families = {}
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            families.setdefault(line.split()[2], set()).add('HELP')
+        elif line.startswith('# TYPE '):
+            families.setdefault(line.split()[2], set()).add('TYPE')
+        else:
+            match = SAMPLE.match(line)
+            assert match, line
+            name = re.sub(r'_(bucket|sum|count)$', '', match.group(1))
+            assert families.get(name, families.get(match.group(1))) == {'HELP', 'TYPE'}, line
+    
+    assert 'vyuhmitra_stage_latency_seconds_count{stage="railradar_fetch"} 1' in text
+    assert 'vyuhmitra_cycle_duration_seconds_bucket{le="60"} 1' in text
+    assert 'vyuhmitra_cycle_duration_seconds_bucket{le="+Inf"} 1' in text
+    assert 'vyuhmitra_upstream_requests_total{upstream="gemini",outcome="timeout"} 1' in text
+    assert 'vyuhmitra_gemini_tokens_total{stage="gemini_analysis",kind="prompt"} 7' in text
+    assert 'vyuhmitra_gemini_parse_total{stage="gemini_analysis",outcome="clean"} 1' in text
+
+
+def test_inf_bucket_equals_count():
+    for seconds in (0.01, 0.3, 7, 500):
+        with mock.patch('time.perf_counter', side_effect=[0, seconds]):
+            with index.timed_stage('gemini_analysis'):
+                pass
+    
+    text = index.render_metrics()
+    assert 'vyuhmitra_stage_latency_seconds_bucket{stage="gemini_analysis",le="+Inf"} 4' in text
+    assert 'vyuhmitra_stage_latency_seconds_count{stage="gemini_analysis"} 4' in text
+    assert 'vyuhmitra_stage_latency_seconds_bucket{stage="gemini_analysis",le="120"} 3' in text
+
+
+def test_thoughts_tokens_counted():
+    usage = {'promptTokenCount': 100, 'candidatesTokenCount': 20,
+             'cachedContentTokenCount': 50, 'thoughtsTokenCount': 300}
+    index.record_gemini_usage('gemini_solutions', {'usageMetadata': usage})
+    index.record_gemini_usage('gemini_solutions', {'usageMetadata': {'thoughtsTokenCount': 5}})
+    
+    assert index.gemini_tokens[('gemini_solutions', 'prompt')] == 100
+    assert index.gemini_tokens[('gemini_solutions', 'response')] == 20
+    assert index.gemini_tokens[('gemini_solutions', 'cached')] == 50
+    assert index.gemini_tokens[('gemini_solutions', 'thoughts')] == 305
+
+
+def test_metrics_route():
+    response = index.app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert '# TYPE vyuhmitra_stage_latency_seconds histogram' in response.get_data(as_text=True)
+
+
+def test_gemini_status_follows_last_outcome():
+    client = index.app.test_client()
+    
+    def gemini_status():
+        return client.get('/api/system/status').get_json()['data']['gemini_ai']
+    
+    assert gemini_status() == 'unknown'
+    index.record_upstream('gemini', 'success')
+    assert gemini_status() == 'connected'
+    index.record_upstream('gemini', 'timeout')
+    assert gemini_status() == 'disconnected'
+    index.record_upstream('gemini', 'success')
+    assert gemini_status() == 'connected'
+
+
+def test_railradar_non_json_body_counted_once_as_error():
+    with mock.patch('requests.get', return_value=make_response()):
+        assert index.fetch_train_data('12164') is None
+    assert index.upstream_requests == {('railradar', 'error'): 1}
+
+
+def test_gemini_non_json_body_counted_as_error():
+    with mock.patch('requests.post', return_value=make_response()):
+        assert index.post_gemini('gemini_analysis', 'prompt', {}) is None
+    assert index.upstream_requests == {('gemini', 'error'): 1}
+
+
+def test_upstream_timeout_counted():
+    with mock.patch('requests.get', side_effect=requests.Timeout()):
+        assert index.fetch_train_data('12164') is None
+    assert index.upstream_requests == {('railradar', 'timeout'): 1}